@@ -0,0 +1,470 @@
+// Copyright 2016 DIANA-HEP
+// 
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+// 
+//     http://www.apache.org/licenses/LICENSE-2.0
+// 
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+package org.dianahep
+
+import java.util.concurrent.ConcurrentHashMap
+import java.util.concurrent.atomic.DoubleAdder
+
+import scala.collection.immutable.SortedMap
+
+package histogrammar {
+  //////////////////////////////////////////////////////////////// thread-safe histograms with shared fill
+
+  // helpers for ConcurrentBinning, ConcurrentSparselyBinning, and ConcurrentCategorizing
+  private[histogrammar] object Concurrent {
+    private[histogrammar] def adder(initial: Double): DoubleAdder = {
+      val out = new DoubleAdder
+      if (initial != 0.0)
+        out.add(initial)
+      out
+    }
+
+    /** Get the adder for `key`, creating it if necessary (without a lambda, so that this compiles on all supported Scala versions). */
+    private[histogrammar] def adderFor[K](bins: ConcurrentHashMap[K, DoubleAdder], key: K): DoubleAdder = {
+      val existing = bins.get(key)
+      if (existing != null)
+        existing
+      else {
+        val fresh = new DoubleAdder
+        val raced = bins.putIfAbsent(key, fresh)
+        if (raced != null) raced else fresh
+      }
+    }
+
+    /** Read every adder once, returning the keys and their sums (dropping bins that are still zero). */
+    private[histogrammar] def sums[K](bins: ConcurrentHashMap[K, DoubleAdder]): Seq[(K, Double)] = {
+      val out = Seq.newBuilder[(K, Double)]
+      val iterator = bins.entrySet.iterator
+      while (iterator.hasNext) {
+        val entry = iterator.next()
+        val sum = entry.getValue.sum
+        if (sum > 0.0)
+          out += ((entry.getKey, sum))
+      }
+      out.result()
+    }
+
+    /** Sum of all adders, without building a snapshot. */
+    private[histogrammar] def total[K](bins: ConcurrentHashMap[K, DoubleAdder]): Double = {
+      var out = 0.0
+      val iterator = bins.values.iterator
+      while (iterator.hasNext)
+        out += iterator.next().sum
+      out
+    }
+
+    /** Keys whose adders are non-zero, without building a snapshot. */
+    private[histogrammar] def filledKeys[K](bins: ConcurrentHashMap[K, DoubleAdder]): Seq[K] = {
+      val out = Seq.newBuilder[K]
+      val iterator = bins.entrySet.iterator
+      while (iterator.hasNext) {
+        val entry = iterator.next()
+        if (entry.getValue.sum > 0.0)
+          out += entry.getKey
+      }
+      out.result()
+    }
+
+    /** Number of non-zero adders, without building a snapshot. */
+    private[histogrammar] def numFilled[K](bins: ConcurrentHashMap[K, DoubleAdder]): Int = {
+      var out = 0
+      val iterator = bins.values.iterator
+      while (iterator.hasNext)
+        if (iterator.next().sum > 0.0)
+          out += 1
+      out
+    }
+  }
+
+  //////////////////////////////////////////////////////////////// ConcurrentBin/ConcurrentBinning
+
+  /** Thread-safe version of [[org.dianahep.histogrammar.Bin]] with counts in every bin: a standard histogram that many threads can fill at once.
+    * 
+    * Ordinary containers must not be filled from several threads at once; the usual alternative is to fill one container per thread and merge them with `+`. That does not work for a long-lived histogram that many threads update while another thread reads it, which is what this container is for. Each bin is a sum of weights (like [[org.dianahep.histogrammar.Counting]]) held in a `java.util.concurrent.atomic.DoubleAdder`.
+    * 
+    * `snapshot` returns an ordinary immutable [[org.dianahep.histogrammar.Binned]] without blocking writers. Each bin is read exactly once and `entries` is computed from those same readings, so a snapshot is always self-consistent, but fills that happen during the snapshot may or may not be included.
+    * 
+    * {{{val hist = ConcurrentBin.ing(100, 0, 10, fill_x)
+    * // from any number of threads:
+    * hist.fill(datum)
+    * // from any thread, at any time:
+    * val binned: Binned[Counted, Counted, Counted, Counted] = hist.snapshot}}}
+    * 
+    * Factory produces mutable [[org.dianahep.histogrammar.ConcurrentBinning]], which serializes (and snapshots) as immutable [[org.dianahep.histogrammar.Binned]].
+    */
+  object ConcurrentBin {
+    /** Create an empty, thread-safe [[org.dianahep.histogrammar.ConcurrentBinning]].
+      * 
+      * @param num Number of bins.
+      * @param low Minimum-value edge of the first bin.
+      * @param high Maximum-value edge of the last bin.
+      * @param quantity Numerical function to split into bins.
+      */
+    def apply[DATUM](num: Int, low: Double, high: Double, quantity: UserFcn[DATUM, Double]) =
+      new ConcurrentBinning[DATUM](low, high, quantity, Array.fill(num)(new DoubleAdder), new DoubleAdder, new DoubleAdder, new DoubleAdder)
+
+    /** Synonym for `apply`. */
+    def ing[DATUM](num: Int, low: Double, high: Double, quantity: UserFcn[DATUM, Double]) = apply(num, low, high, quantity)
+  }
+
+  /** Accumulating a quantity into equally spaced bins between specified limits, safe to fill from many threads at once.
+    * 
+    * Use the factory [[org.dianahep.histogrammar.ConcurrentBin]] to construct an instance.
+    * 
+    * Unlike [[org.dianahep.histogrammar.Binning]], `entries` is not stored separately: it is the sum of all bins, underflow, overflow, and nanflow.
+    * 
+    * @param low Minimum-value edge of the first bin.
+    * @param high Maximum-value edge of the last bin.
+    * @param quantity Numerical function to track.
+    * @param valueSums Sums of weights in each bin.
+    * @param underflowSum Sum of weights below the first bin.
+    * @param overflowSum Sum of weights above the last bin.
+    * @param nanflowSum Sum of weights for data that resulted in `NaN`.
+    */
+  class ConcurrentBinning[DATUM] private[histogrammar](
+    val low: Double,
+    val high: Double,
+    val quantity: UserFcn[DATUM, Double],
+    valueSums: Array[DoubleAdder],
+    underflowSum: DoubleAdder,
+    overflowSum: DoubleAdder,
+    nanflowSum: DoubleAdder) extends Container[ConcurrentBinning[DATUM]] with AggregationOnData with NumericalQuantity[DATUM] with Bin.Methods {
+
+    if (low >= high)
+      throw new ContainerException(s"low ($low) must be less than high ($high)")
+    if (valueSums.size < 1)
+      throw new ContainerException(s"values (${valueSums.toSeq}) must have at least one element")
+    def num = valueSums.size
+
+    type Type = ConcurrentBinning[DATUM]
+    type EdType = Binned[Counted, Counted, Counted, Counted]
+    type Datum = DATUM
+    def factory = Bin
+
+    def entries = {
+      var out = underflowSum.sum + overflowSum.sum + nanflowSum.sum
+      var i = 0
+      while (i < valueSums.size) {
+        out += valueSums(i).sum
+        i += 1
+      }
+      out
+    }
+    def entries_=(x: Double): Unit = throw new ContainerException(s"cannot set entries of ${getClass.getName}; it is the sum of its bins")
+
+    /** Immutable copy of the current state; does not block threads that are filling. */
+    def snapshot: Binned[Counted, Counted, Counted, Counted] = {
+      val counts = valueSums.map(_.sum)
+      val underflow = underflowSum.sum
+      val overflow = overflowSum.sum
+      val nanflow = nanflowSum.sum
+      new Binned(low, high, counts.sum + underflow + overflow + nanflow, quantity.name, counts.toSeq.map(new Counted(_)), new Counted(underflow), new Counted(overflow), new Counted(nanflow))
+    }
+    override def toImmutable = snapshot
+
+    /** Current counts in each bin (each read once, but not all at the same instant). */
+    def values: Seq[Counted] = valueSums.toSeq.map(x => new Counted(x.sum))
+    /** Current count in the bin at a given index. */
+    def at(index: Int) = new Counted(valueSums(index).sum)
+    /** Current count below the first bin. */
+    def underflow = new Counted(underflowSum.sum)
+    /** Current count above the last bin. */
+    def overflow = new Counted(overflowSum.sum)
+    /** Current count of data that resulted in `NaN`. */
+    def nanflow = new Counted(nanflowSum.sum)
+
+    private def fromSnapshot(binned: Binned[Counted, Counted, Counted, Counted]) =
+      new ConcurrentBinning[DATUM](low, high, quantity, binned.values.map(x => Concurrent.adder(x.entries)).toArray, Concurrent.adder(binned.underflow.entries), Concurrent.adder(binned.overflow.entries), Concurrent.adder(binned.nanflow.entries))
+
+    def zero = new ConcurrentBinning[DATUM](low, high, quantity, Array.fill(num)(new DoubleAdder), new DoubleAdder, new DoubleAdder, new DoubleAdder)
+    def +(that: ConcurrentBinning[DATUM]): ConcurrentBinning[DATUM] = {
+      if (this.quantity.name != that.quantity.name)
+        throw new ContainerException(s"cannot add ${getClass.getName} because quantity name differs (${this.quantity.name} vs ${that.quantity.name})")
+      if (this.low != that.low)
+        throw new ContainerException(s"cannot add ${getClass.getName} because low differs (${this.low} vs ${that.low})")
+      if (this.high != that.high)
+        throw new ContainerException(s"cannot add ${getClass.getName} because high differs (${this.high} vs ${that.high})")
+      if (this.num != that.num)
+        throw new ContainerException(s"cannot add ${getClass.getName} because number of values differs (${this.num} vs ${that.num})")
+      fromSnapshot(this.snapshot + that.snapshot)
+    }
+    def *(factor: Double) = fromSnapshot(snapshot * factor)
+
+    def fill[SUB <: Datum](datum: SUB, weight: Double = 1.0): Unit = {
+      if (weight > 0.0) {
+        val q = quantity(datum)
+
+        if (under(q))
+          underflowSum.add(weight)
+        else if (over(q))
+          overflowSum.add(weight)
+        else if (nan(q))
+          nanflowSum.add(weight)
+        else
+          valueSums(bin(q)).add(weight)
+      }
+    }
+
+    def children = Nil
+
+    def toJsonFragment(suppressName: Boolean) = snapshot.toJsonFragment(suppressName)
+
+    override def toString() = s"""<ConcurrentBinning num=$num low=$low high=$high>"""
+    override def equals(that: Any) = that match {
+      case that: ConcurrentBinning[DATUM] => this.quantity == that.quantity  &&  this.snapshot == that.snapshot
+      case _ => false
+    }
+    override def hashCode() = (quantity, snapshot).hashCode
+  }
+
+  //////////////////////////////////////////////////////////////// ConcurrentSparselyBin/ConcurrentSparselyBinning
+
+  /** Thread-safe version of [[org.dianahep.histogrammar.SparselyBin]] with counts in every bin, creating bins whenever their `entries` would be non-zero.
+    * 
+    * Bins are created in a `java.util.concurrent.ConcurrentHashMap`; otherwise this behaves like [[org.dianahep.histogrammar.ConcurrentBin]], including its self-consistent, non-blocking `snapshot`.
+    * 
+    * Factory produces mutable [[org.dianahep.histogrammar.ConcurrentSparselyBinning]], which serializes (and snapshots) as immutable [[org.dianahep.histogrammar.SparselyBinned]].
+    */
+  object ConcurrentSparselyBin {
+    /** Create an empty, thread-safe [[org.dianahep.histogrammar.ConcurrentSparselyBinning]].
+      * 
+      * @param binWidth Width of the equally sized bins.
+      * @param quantity Numerical function to split into bins.
+      * @param origin Left edge of the bin whose index is zero.
+      */
+    def apply[DATUM](binWidth: Double, quantity: UserFcn[DATUM, Double], origin: Double = 0.0) =
+      new ConcurrentSparselyBinning[DATUM](binWidth, quantity, new ConcurrentHashMap[java.lang.Long, DoubleAdder], new DoubleAdder, origin)
+
+    /** Synonym for `apply`. */
+    def ing[DATUM](binWidth: Double, quantity: UserFcn[DATUM, Double], origin: Double = 0.0) = apply(binWidth, quantity, origin)
+  }
+
+  /** Accumulating a quantity into equally spaced bins, creating new bins as necessary, safe to fill from many threads at once.
+    * 
+    * Use the factory [[org.dianahep.histogrammar.ConcurrentSparselyBin]] to construct an instance.
+    * 
+    * Unlike [[org.dianahep.histogrammar.SparselyBinning]], `entries` is not stored separately: it is the sum of all bins and nanflow.
+    * 
+    * @param binWidth Width of the equally sized bins.
+    * @param quantity Numerical function to track.
+    * @param binSums Sums of weights in each bin, keyed by bin index.
+    * @param nanflowSum Sum of weights for data that resulted in `NaN`.
+    * @param origin Left edge of the bin whose index is zero.
+    */
+  class ConcurrentSparselyBinning[DATUM] private[histogrammar](
+    val binWidth: Double,
+    val quantity: UserFcn[DATUM, Double],
+    binSums: ConcurrentHashMap[java.lang.Long, DoubleAdder],
+    nanflowSum: DoubleAdder,
+    val origin: Double) extends Container[ConcurrentSparselyBinning[DATUM]] with AggregationOnData with NumericalQuantity[DATUM] with SparselyBin.Methods {
+
+    if (binWidth <= 0.0)
+      throw new ContainerException(s"binWidth ($binWidth) must be greater than zero")
+
+    type Type = ConcurrentSparselyBinning[DATUM]
+    type EdType = SparselyBinned[Counted, Counted]
+    type Datum = DATUM
+    def factory = SparselyBin
+
+    def entries = Concurrent.total(binSums) + nanflowSum.sum
+    def entries_=(x: Double): Unit = throw new ContainerException(s"cannot set entries of ${getClass.getName}; it is the sum of its bins")
+
+    /** Immutable copy of the current state; does not block threads that are filling. */
+    def snapshot: SparselyBinned[Counted, Counted] = {
+      val bins = Concurrent.sums(binSums) map {case (i, x) => (i.longValue, new Counted(x))}
+      val nanflow = nanflowSum.sum
+      new SparselyBinned[Counted, Counted](binWidth, bins.map(_._2.entries).sum + nanflow, quantity.name, Count.name, SortedMap[Long, Counted](bins: _*), new Counted(nanflow), origin)
+    }
+    override def toImmutable = snapshot
+
+    private def fromSnapshot(binned: SparselyBinned[Counted, Counted]) = {
+      val bins = new ConcurrentHashMap[java.lang.Long, DoubleAdder]
+      binned.bins foreach {case (i, x) => bins.put(java.lang.Long.valueOf(i), Concurrent.adder(x.entries))}
+      new ConcurrentSparselyBinning[DATUM](binWidth, quantity, bins, Concurrent.adder(binned.nanflow.entries), origin)
+    }
+
+    def zero = new ConcurrentSparselyBinning[DATUM](binWidth, quantity, new ConcurrentHashMap[java.lang.Long, DoubleAdder], new DoubleAdder, origin)
+    def +(that: ConcurrentSparselyBinning[DATUM]) = {
+      if (this.quantity.name != that.quantity.name)
+        throw new ContainerException(s"cannot add ${getClass.getName} because quantity name differs (${this.quantity.name} vs ${that.quantity.name})")
+      if (this.binWidth != that.binWidth)
+        throw new ContainerException(s"cannot add ${getClass.getName} because binWidth differs (${this.binWidth} vs ${that.binWidth})")
+      if (this.origin != that.origin)
+        throw new ContainerException(s"cannot add ${getClass.getName} because origin differs (${this.origin} vs ${that.origin})")
+      fromSnapshot(this.snapshot + that.snapshot)
+    }
+    def *(factor: Double) = fromSnapshot(snapshot * factor)
+
+    def fill[SUB <: Datum](datum: SUB, weight: Double = 1.0): Unit = {
+      if (weight > 0.0) {
+        val q = quantity(datum)
+
+        if (nan(q))
+          nanflowSum.add(weight)
+        else
+          Concurrent.adderFor(binSums, java.lang.Long.valueOf(bin(q))).add(weight)
+      }
+    }
+
+    /** Lowest and highest non-empty bin index, found in one pass over the adders. */
+    private def filledBounds: Option[(Long, Long)] = {
+      var min = java.lang.Long.MAX_VALUE
+      var max = java.lang.Long.MIN_VALUE
+      var any = false
+      val iterator = binSums.entrySet.iterator
+      while (iterator.hasNext) {
+        val entry = iterator.next()
+        if (entry.getValue.sum > 0.0) {
+          val i = entry.getKey.longValue
+          if (i < min) min = i
+          if (i > max) max = i
+          any = true
+        }
+      }
+      if (any) Some((min, max)) else None
+    }
+
+    def numFilled = Concurrent.numFilled(binSums)
+    def num = filledBounds match {
+      case Some((min, max)) => 1L + max - min
+      case None => 0L
+    }
+    def minBin = filledBounds.map(_._1)
+    def maxBin = filledBounds.map(_._2)
+    def low = minBin.map(_ * binWidth + origin)
+    def high = maxBin.map(i => (i + 1L) * binWidth + origin)
+    def indexes = Concurrent.filledKeys(binSums).map(_.longValue).sorted
+    /** Current counts in the non-empty bins (each read once, but not all at the same instant). */
+    def bins: SortedMap[Long, Counted] = SortedMap[Long, Counted](Concurrent.sums(binSums) map {case (i, x) => (i.longValue, new Counted(x))}: _*)
+    /** Extract the current count at a given index, if that bin is non-empty. */
+    def at(index: Long) = {
+      val adder = binSums.get(java.lang.Long.valueOf(index))
+      if (adder == null) None else Some(adder.sum).filter(_ > 0.0).map(new Counted(_))
+    }
+    def values = bins.map(_._2)
+    def range(index: Long) = (index * binWidth + origin, (index + 1) * binWidth + origin)
+
+    def children = Nil
+
+    def toJsonFragment(suppressName: Boolean) = snapshot.toJsonFragment(suppressName)
+
+    override def toString() = s"""<ConcurrentSparselyBinning binWidth=$binWidth>"""
+    override def equals(that: Any) = that match {
+      case that: ConcurrentSparselyBinning[DATUM] => this.quantity == that.quantity  &&  this.snapshot == that.snapshot
+      case _ => false
+    }
+    override def hashCode() = (quantity, snapshot).hashCode
+  }
+
+  //////////////////////////////////////////////////////////////// ConcurrentCategorize/ConcurrentCategorizing
+
+  /** Thread-safe version of [[org.dianahep.histogrammar.Categorize]] with counts in every category: a bar chart that many threads can fill at once.
+    * 
+    * Categories are created in a `java.util.concurrent.ConcurrentHashMap`; otherwise this behaves like [[org.dianahep.histogrammar.ConcurrentBin]], including its self-consistent, non-blocking `snapshot`.
+    * 
+    * Factory produces mutable [[org.dianahep.histogrammar.ConcurrentCategorizing]], which serializes (and snapshots) as immutable [[org.dianahep.histogrammar.Categorized]].
+    */
+  object ConcurrentCategorize {
+    /** Create an empty, thread-safe [[org.dianahep.histogrammar.ConcurrentCategorizing]].
+      * 
+      * @param quantity String-valued function that determines the category.
+      */
+    def apply[DATUM](quantity: UserFcn[DATUM, String]) =
+      new ConcurrentCategorizing[DATUM](quantity, new ConcurrentHashMap[String, DoubleAdder])
+
+    /** Synonym for `apply`. */
+    def ing[DATUM](quantity: UserFcn[DATUM, String]) = apply(quantity)
+  }
+
+  /** Accumulating a quantity by splitting it by its categorical (string-based) value, safe to fill from many threads at once.
+    * 
+    * Use the factory [[org.dianahep.histogrammar.ConcurrentCategorize]] to construct an instance.
+    * 
+    * Unlike [[org.dianahep.histogrammar.Categorizing]], `entries` is not stored separately: it is the sum of all categories.
+    * 
+    * @param quantity String-valued function that determines the category.
+    * @param binSums Sums of weights in each category.
+    */
+  class ConcurrentCategorizing[DATUM] private[histogrammar](val quantity: UserFcn[DATUM, String], binSums: ConcurrentHashMap[String, DoubleAdder]) extends Container[ConcurrentCategorizing[DATUM]] with AggregationOnData with CategoricalQuantity[DATUM] {
+    type Type = ConcurrentCategorizing[DATUM]
+    type EdType = Categorized[Counted]
+    type Datum = DATUM
+    def factory = Categorize
+
+    def entries = Concurrent.total(binSums)
+    def entries_=(x: Double): Unit = throw new ContainerException(s"cannot set entries of ${getClass.getName}; it is the sum of its bins")
+
+    /** Immutable copy of the current state; does not block threads that are filling. */
+    def snapshot: Categorized[Counted] = {
+      val bins = Concurrent.sums(binSums)
+      new Categorized[Counted](bins.map(_._2).sum, quantity.name, Count.name, bins.map({case (c, x) => (c, new Counted(x))}).toMap)
+    }
+    override def toImmutable = snapshot
+
+    /** Number of non-empty categories. */
+    def size = Concurrent.numFilled(binSums)
+    /** Iterable over the non-empty categories. */
+    def keys: Iterable[String] = Concurrent.filledKeys(binSums)
+    /** Iterable over the current counts of the non-empty categories. */
+    def values: Iterable[Counted] = Concurrent.sums(binSums).map(x => new Counted(x._2))
+    /** Set of non-empty categories. */
+    def keySet: Set[String] = Concurrent.filledKeys(binSums).toSet
+    /** Attempt to get the current count of key `x`, returning `None` if it does not exist. */
+    def get(x: String) = {
+      val adder = binSums.get(x)
+      if (adder == null) None else Some(adder.sum).filter(_ > 0.0).map(new Counted(_))
+    }
+    /** Attempt to get the current count of key `x`, throwing an exception if it does not exist. */
+    def apply(x: String) = get(x) match {
+      case Some(out) => out
+      case None => throw new java.util.NoSuchElementException(s"key not found: $x")
+    }
+    /** Attempt to get the current count of key `x`, returning an alternative if it does not exist. */
+    def getOrElse(x: String, default: => Counted) = get(x).getOrElse(default)
+
+    private def fromSnapshot(categorized: Categorized[Counted]) = {
+      val bins = new ConcurrentHashMap[String, DoubleAdder]
+      categorized.bins foreach {case (c, x) => bins.put(c, Concurrent.adder(x.entries))}
+      new ConcurrentCategorizing[DATUM](quantity, bins)
+    }
+
+    def zero = new ConcurrentCategorizing[DATUM](quantity, new ConcurrentHashMap[String, DoubleAdder])
+    def +(that: ConcurrentCategorizing[DATUM]) =
+      if (this.quantity.name != that.quantity.name)
+        throw new ContainerException(s"cannot add ${getClass.getName} because quantity name differs (${this.quantity.name} vs ${that.quantity.name})")
+      else
+        fromSnapshot(this.snapshot + that.snapshot)
+    def *(factor: Double) = fromSnapshot(snapshot * factor)
+
+    def fill[SUB <: Datum](datum: SUB, weight: Double = 1.0): Unit = {
+      if (weight > 0.0) {
+        val qd = quantity(datum)
+        val q = if (qd == null) "NaN" else qd
+        Concurrent.adderFor(binSums, q).add(weight)
+      }
+    }
+
+    def children = Nil
+
+    def toJsonFragment(suppressName: Boolean) = snapshot.toJsonFragment(suppressName)
+
+    override def toString() = s"""<ConcurrentCategorizing size=$size>"""
+    override def equals(that: Any) = that match {
+      case that: ConcurrentCategorizing[DATUM] => this.quantity == that.quantity  &&  this.snapshot == that.snapshot
+      case _ => false
+    }
+    override def hashCode() = (quantity, snapshot).hashCode
+  }
+}
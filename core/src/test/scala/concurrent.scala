@@ -0,0 +1,120 @@
+// Copyright 2016 DIANA-HEP
+// 
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+// 
+//     http://www.apache.org/licenses/LICENSE-2.0
+// 
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+package test.scala.histogrammar
+
+import org.scalatest.flatspec.AnyFlatSpec
+import org.scalatest.matchers.should.Matchers
+
+import org.dianahep.histogrammar._
+
+class ConcurrentSuite extends AnyFlatSpec with Matchers {
+  import Contention.{data, numericalQuantity, categoryQuantity}
+
+  val fillsPerThread = 20000
+  val threadCounts = Seq(1, 4, 8)
+
+  for (makeTarget <- Contention.targets; numThreads <- threadCounts) {
+    makeTarget().name should s"fill consistently and take consistent snapshots from $numThreads threads" in {
+      val target = makeTarget()
+      val (_, snapshots) = Contention.run(target, numThreads, fillsPerThread, readerPauseMillis = 0)
+      snapshots should be > 0
+      target.snapshot() should be (target.expected(Contention.multiplicities(numThreads, fillsPerThread)))
+    }
+  }
+
+  def concurrentBin(from: Int, until: Int) = {
+    val out = ConcurrentBin.ing(100, 0.0, 10.0, numericalQuantity)
+    data.slice(from, until).foreach(out.fill(_))
+    out
+  }
+  def concurrentSparselyBin(from: Int, until: Int) = {
+    val out = ConcurrentSparselyBin.ing(0.1, numericalQuantity)
+    data.slice(from, until).foreach(out.fill(_))
+    out
+  }
+  def concurrentCategorize(from: Int, until: Int) = {
+    val out = ConcurrentCategorize.ing(categoryQuantity)
+    data.slice(from, until).foreach(out.fill(_))
+    out
+  }
+
+  "ConcurrentBinning" should "agree with Binned on +, *, zero, and JSON" in {
+    val a = concurrentBin(0, 5000)
+    val b = concurrentBin(5000, 6000)
+    (a + b).snapshot should be (a.snapshot + b.snapshot)
+    (a * 2.0).snapshot should be (a.snapshot * 2.0)
+    a.zero.snapshot should be (a.snapshot.zero)
+    Factory.fromJson(a.toJson) should be (a.snapshot)
+    a.entries should be (a.snapshot.entries)
+  }
+
+  it should "read bins without a snapshot" in {
+    val a = concurrentBin(0, 5000)
+    val snapshot = a.snapshot
+    a.values should be (snapshot.values)
+    a.at(42) should be (snapshot.at(42))
+    a.underflow should be (snapshot.underflow)
+    a.overflow should be (snapshot.overflow)
+    a.nanflow should be (snapshot.nanflow)
+  }
+
+  "ConcurrentSparselyBinning" should "agree with SparselyBinned on +, *, zero, and JSON" in {
+    val a = concurrentSparselyBin(0, 5000)
+    val b = concurrentSparselyBin(5000, 6000)
+    (a + b).snapshot should be (a.snapshot + b.snapshot)
+    (a * 2.0).snapshot should be (a.snapshot * 2.0)
+    a.zero.snapshot should be (a.snapshot.zero)
+    Factory.fromJson(a.toJson) should be (a.snapshot)
+    a.entries should be (a.snapshot.entries)
+  }
+
+  it should "read bins and bounds without a snapshot" in {
+    val a = concurrentSparselyBin(0, 5000)
+    val snapshot = a.snapshot
+    a.bins should be (snapshot.bins)
+    a.values.toList should be (snapshot.values.toList)
+    a.indexes should be (snapshot.indexes)
+    a.at(50) should be (snapshot.at(50))
+    a.at(1000000) should be (None)
+    a.numFilled should be (snapshot.numFilled)
+    a.num should be (snapshot.num)
+    a.minBin should be (snapshot.minBin)
+    a.maxBin should be (snapshot.maxBin)
+    a.low should be (snapshot.low)
+    a.high should be (snapshot.high)
+  }
+
+  "ConcurrentCategorizing" should "agree with Categorized on +, *, zero, and JSON" in {
+    val a = concurrentCategorize(0, 5000)
+    val b = concurrentCategorize(5000, 6000)
+    (a + b).snapshot should be (a.snapshot + b.snapshot)
+    (a * 2.0).snapshot should be (a.snapshot * 2.0)
+    a.zero.snapshot should be (a.snapshot.zero)
+    Factory.fromJson(a.toJson) should be (a.snapshot)
+    a.entries should be (a.snapshot.entries)
+  }
+
+  it should "read categories without a snapshot" in {
+    val a = concurrentCategorize(0, 5000)
+    val snapshot = a.snapshot
+    a.size should be (snapshot.size)
+    a.keySet should be (snapshot.keySet)
+    a.keys.toSet should be (snapshot.keys.toSet)
+    a.get("category15") should be (snapshot.get("category15"))
+    a("category15") should be (snapshot("category15"))
+    a.get("no such category") should be (None)
+    a.getOrElse("no such category", Count.ed(0.0)) should be (Count.ed(0.0))
+  }
+}
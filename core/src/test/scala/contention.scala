@@ -0,0 +1,247 @@
+// Copyright 2016 DIANA-HEP
+// 
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+// 
+//     http://www.apache.org/licenses/LICENSE-2.0
+// 
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+package test.scala.histogrammar
+
+import java.util.concurrent.CountDownLatch
+import java.util.concurrent.atomic.AtomicBoolean
+import java.util.concurrent.atomic.AtomicReference
+
+import scala.collection.immutable.SortedMap
+
+import org.dianahep.histogrammar._
+
+/** Contention benchmark for the thread-safe containers: many threads fill one shared histogram while another thread takes snapshots.
+  * 
+  * Each thread-safe container ([[org.dianahep.histogrammar.ConcurrentBinning]], [[org.dianahep.histogrammar.ConcurrentSparselyBinning]], [[org.dianahep.histogrammar.ConcurrentCategorizing]]) is compared with its ordinary counterpart behind a single lock, for 1 to 64 filling threads. Both sides build the same immutable container when they take a snapshot. Every snapshot taken during a run must be self-consistent, and the final one must equal an ordinary container filled one datum at a time with the same data. [[test.scala.histogrammar.ConcurrentSuite]] runs the same checks with small fill counts.
+  * 
+  * Run it from the test classpath with `scala test.scala.histogrammar.Contention [fillsPerThread]`.
+  */
+object Contention {
+  val threadCounts = Seq(1, 2, 4, 8, 16, 32, 64)
+
+  /** Fixed pseudo-random data, shared (read-only) by all threads. */
+  val data: Array[Double] = {
+    val random = new java.util.Random(12345)
+    Array.fill(1 << 16)(random.nextGaussian() * 3.0 + 5.0)
+  }
+  val categories = Array.tabulate(32)(i => s"category$i")
+
+  /** Index into `data` of the `i`th fill by thread `t`. */
+  def dataIndex(t: Int, i: Int) = (i + t * 7919) & (data.size - 1)
+
+  /** Number of times each element of `data` is filled in a run, to use as weights for a one-at-a-time reference fill. */
+  def multiplicities(numThreads: Int, fillsPerThread: Int): Array[Double] = {
+    val out = Array.fill(data.size)((fillsPerThread / data.size).toDouble * numThreads)
+    for (t <- 0 until numThreads; i <- 0 until fillsPerThread % data.size)
+      out(dataIndex(t, i)) += 1.0
+    out
+  }
+
+  def numericalQuantity = {x: Double => x}
+  def categoryQuantity = {x: Double => categories((x.abs * 3.0).toInt & 31)}
+
+  def binned(hist: Binning[Double, Counting, Counting, Counting, Counting]) =
+    Bin.ed(hist.low, hist.high, hist.entries, hist.values.map(v => Count.ed(v.entries)), Count.ed(hist.underflow.entries), Count.ed(hist.overflow.entries), Count.ed(hist.nanflow.entries))
+  def sparselyBinned(hist: SparselyBinning[Double, Counting, Counting]) =
+    SparselyBin.ed(hist.binWidth, hist.entries, Count.name, SortedMap(hist.bins.toSeq map {case (i, v) => (i, Count.ed(v.entries))}: _*), Count.ed(hist.nanflow.entries), hist.origin)
+  def categorized(hist: Categorizing[Double, Counting]) =
+    Categorize.ed(hist.entries, Count.name, hist.bins.toMap map {case (c, v) => (c, Count.ed(v.entries))})
+
+  /** Fill an ordinary container one datum at a time, weighting each element of `data` by `weights`. */
+  def fillReference(hist: Aggregation {type Datum = Double}, weights: Array[Double]): Unit = {
+    var j = 0
+    while (j < data.size) {
+      hist.fill(data(j), weights(j))
+      j += 1
+    }
+  }
+
+  /** A shared container under test: `fill` is called from many threads and `snapshot` from one reader. */
+  trait Target {
+    def name: String
+    def fill(x: Double): Unit
+    /** Immutable copy of the shared container. */
+    def snapshot(): Container[_]
+    /** The same immutable container, filled one datum at a time by an ordinary container. */
+    def expected(weights: Array[Double]): Container[_]
+  }
+
+  def targets: Seq[() => Target] = Seq(
+    () => new Target {
+      val hist = ConcurrentBin.ing(100, 0.0, 10.0, numericalQuantity)
+      def name = "ConcurrentBinning"
+      def fill(x: Double) = hist.fill(x)
+      def snapshot() = hist.snapshot
+      def expected(weights: Array[Double]) = {
+        val reference = Bin.ing(100, 0.0, 10.0, numericalQuantity)
+        fillReference(reference, weights)
+        binned(reference)
+      }
+    },
+    () => new Target {
+      val hist = Bin.ing(100, 0.0, 10.0, numericalQuantity)
+      def name = "synchronized Binning"
+      def fill(x: Double) = hist.synchronized { hist.fill(x) }
+      def snapshot() = hist.synchronized { binned(hist) }
+      def expected(weights: Array[Double]) = {
+        val reference = Bin.ing(100, 0.0, 10.0, numericalQuantity)
+        fillReference(reference, weights)
+        binned(reference)
+      }
+    },
+    () => new Target {
+      val hist = ConcurrentSparselyBin.ing(0.1, numericalQuantity)
+      def name = "ConcurrentSparselyBinning"
+      def fill(x: Double) = hist.fill(x)
+      def snapshot() = hist.snapshot
+      def expected(weights: Array[Double]) = {
+        val reference = SparselyBin.ing(0.1, numericalQuantity)
+        fillReference(reference, weights)
+        sparselyBinned(reference)
+      }
+    },
+    () => new Target {
+      val hist = SparselyBin.ing(0.1, numericalQuantity)
+      def name = "synchronized SparselyBinning"
+      def fill(x: Double) = hist.synchronized { hist.fill(x) }
+      def snapshot() = hist.synchronized { sparselyBinned(hist) }
+      def expected(weights: Array[Double]) = {
+        val reference = SparselyBin.ing(0.1, numericalQuantity)
+        fillReference(reference, weights)
+        sparselyBinned(reference)
+      }
+    },
+    () => new Target {
+      val hist = ConcurrentCategorize.ing(categoryQuantity)
+      def name = "ConcurrentCategorizing"
+      def fill(x: Double) = hist.fill(x)
+      def snapshot() = hist.snapshot
+      def expected(weights: Array[Double]) = {
+        val reference = Categorize.ing(categoryQuantity)
+        fillReference(reference, weights)
+        categorized(reference)
+      }
+    },
+    () => new Target {
+      val hist = Categorize.ing(categoryQuantity)
+      def name = "synchronized Categorizing"
+      def fill(x: Double) = hist.synchronized { hist.fill(x) }
+      def snapshot() = hist.synchronized { categorized(hist) }
+      def expected(weights: Array[Double]) = {
+        val reference = Categorize.ing(categoryQuantity)
+        fillReference(reference, weights)
+        categorized(reference)
+      }
+    })
+
+  /** Check one snapshot taken during a run: its `entries` must equal the sum of its bins (including under/over/nanflow), must not decrease, and must not exceed the number of fills. Returns its `entries`. */
+  def checkSnapshot(name: String, snapshot: Container[_], previous: Double, maximum: Double): Double = {
+    val entries = snapshot.entries
+    val parts = snapshot.children.map(_.entries).sum
+    assert(entries == parts, s"$name: snapshot entries $entries differs from the sum of its bins $parts")
+    assert(entries >= previous, s"$name: snapshot entries decreased from $previous to $entries")
+    assert(entries <= maximum, s"$name: snapshot entries $entries exceeds the number of fills $maximum")
+    entries
+  }
+
+  /** Fill `target` from `numThreads` threads while a reader checks snapshots of it; return (seconds, number of snapshots).
+    * 
+    * The reader pauses `readerPauseMillis` between snapshots (zero to snapshot as often as possible). Failures in any thread are rethrown here.
+    */
+  def run(target: Target, numThreads: Int, fillsPerThread: Int, readerPauseMillis: Int = 1): (Double, Int) = {
+    val ready = new CountDownLatch(numThreads)
+    val start = new CountDownLatch(1)
+    val done = new AtomicBoolean(false)
+    val failure = new AtomicReference[Throwable](null)
+    val maximum = numThreads.toDouble * fillsPerThread
+    var snapshots = 0
+
+    val reader = new Thread(new Runnable {
+      def run(): Unit =
+        try {
+          start.await()
+          var previous = 0.0
+          do {
+            previous = checkSnapshot(target.name, target.snapshot(), previous, maximum)
+            snapshots += 1
+            if (readerPauseMillis > 0)
+              Thread.sleep(readerPauseMillis)
+            else
+              Thread.`yield`()
+          } while (!done.get)
+        }
+        catch {
+          case err: Throwable => failure.compareAndSet(null, err)
+        }
+    })
+
+    val writers = (0 until numThreads) map {t =>
+      new Thread(new Runnable {
+        def run(): Unit =
+          try {
+            var i = 0
+            ready.countDown()
+            start.await()
+            while (i < fillsPerThread) {
+              target.fill(data(dataIndex(t, i)))
+              i += 1
+            }
+          }
+          catch {
+            case err: Throwable => failure.compareAndSet(null, err)
+          }
+      })
+    }
+
+    writers.foreach(_.start())
+    reader.start()
+    ready.await()
+    val before = System.nanoTime
+    start.countDown()
+    writers.foreach(_.join())
+    val after = System.nanoTime
+    done.set(true)
+    reader.join()
+
+    if (failure.get != null)
+      throw failure.get
+
+    ((after - before) / 1e9, snapshots)
+  }
+
+  /** Check that the final state of `target` equals an ordinary container filled one datum at a time with the same data. */
+  def verify(target: Target, numThreads: Int, fillsPerThread: Int): Unit =
+    assert(target.snapshot() == target.expected(multiplicities(numThreads, fillsPerThread)), s"${target.name} with $numThreads threads differs from the same data filled one at a time")
+
+  def main(args: Array[String]): Unit = {
+    val fillsPerThread = if (args.isEmpty) 1000000 else args(0).toInt
+
+    // warm up the JIT before timing anything
+    targets foreach {makeTarget =>
+      val target = makeTarget()
+      run(target, 4, fillsPerThread / 10)
+      verify(target, 4, fillsPerThread / 10)
+    }
+
+    println(f"${"container"}%-30s ${"threads"}%8s ${"Mfills/s"}%10s ${"ns/fill"}%10s ${"snapshots"}%10s")
+    for (makeTarget <- targets; numThreads <- threadCounts) {
+      val target = makeTarget()
+      val (seconds, snapshots) = run(target, numThreads, fillsPerThread)
+      verify(target, numThreads, fillsPerThread)
+      val fills = numThreads.toDouble * fillsPerThread
+      println(f"${target.name}%-30s $numThreads%8d ${fills / seconds / 1e6}%10.2f ${seconds * 1e9 / fills}%10.2f $snapshots%10d")
+    }
+  }
+}
@@ -360,7 +360,7 @@ if __name__ == "__main__":
         artifactid = "histogrammar_2.10",
         version = VERSION,
         profiles = "",
-        javaversion = javaversion17,
+        javaversion = javaversion18,
         dependencies = '''  <dependencies>
     <dependency>
       <groupId>org.scala-lang</groupId>